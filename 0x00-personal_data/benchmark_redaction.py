@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Benchmark of filter_datum: lines redacted per second by the single-pass
+compiled pattern against the previous one-re.sub-per-field version.
+"""
+import re
+import sys
+import timeit
+from typing import List
+
+from filtered_logger import PII_FIELDS, filter_datum
+
+
+def filter_datum_per_field(fields: List[str], redaction: str, message: str,
+                           separator: str) -> str:
+    """
+    Previous implementation of filter_datum, kept for comparison.
+    """
+    for field in fields:
+        message = re.sub(f'{field}=[^{separator}]*',
+                         f'{field}={redaction}', message)
+    return message
+
+
+def main(lines: int = 100000):
+    """
+    Redacts the same log line `lines` times with both implementations
+    and prints their throughput.
+    """
+    message = "name=Bob Dylan;email=bob@dylan.com;phone=(555) 555-5555;" \
+              "ssn=000-123-0000;password=bcrypt_hash;ip=192.168.0.1;" \
+              "last_login=2019-11-14 06:16:24;user_agent=Mozilla/5.0;"
+    assert filter_datum(PII_FIELDS, "***", message, ";") == \
+        filter_datum_per_field(PII_FIELDS, "***", message, ";")
+    for func in (filter_datum_per_field, filter_datum):
+        seconds = timeit.timeit(
+            lambda: func(PII_FIELDS, "***", message, ";"), number=lines)
+        print(f"{func.__name__}: {lines / seconds:,.0f} lines/s")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -4,20 +4,100 @@ Module for password hashing
 """
 
 import bcrypt
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Tuple, Union
 
+# bcrypt cost (log2 of the rounds) used for new hashes
+ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+MIN_ROUNDS = int(os.getenv('BCRYPT_MIN_ROUNDS', '10'))
+MAX_ROUNDS = int(os.getenv('BCRYPT_MAX_ROUNDS', '16'))
 
-def hash_password(password: str) -> bytes:
+
+def calibrate_rounds(target_ms: float, min_rounds: int = MIN_ROUNDS,
+                     max_rounds: int = MAX_ROUNDS) -> int:
+    """
+    Finds the highest bcrypt cost whose hash takes at most target_ms on
+    this machine. Each extra round doubles the time, so one hash at
+    min_rounds is timed and extrapolated.
+
+    Args:
+        target_ms (float): The time budget of one hash, in milliseconds.
+        min_rounds (int): The lowest cost ever returned.
+        max_rounds (int): The highest cost ever returned.
+
+    Returns:
+        int: The bcrypt cost to use.
+    """
+    start = time.perf_counter()
+    bcrypt.hashpw(b"calibration", bcrypt.gensalt(min_rounds))
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if elapsed_ms <= 0 or elapsed_ms >= target_ms:
+        return min_rounds
+    rounds = min_rounds + int(math.log2(target_ms / elapsed_ms))
+    return max(min_rounds, min(rounds, max_rounds))
+
+
+def calibrate(target_ms: float) -> int:
+    """
+    Sets the cost used by hash_password from calibrate_rounds.
+
+    Args:
+        target_ms (float): The time budget of one hash, in milliseconds.
+
+    Returns:
+        int: The bcrypt cost now in use.
+    """
+    global ROUNDS
+    ROUNDS = calibrate_rounds(target_ms)
+    return ROUNDS
+
+
+def hash_rounds(hashed_password: Union[bytes, str]) -> int:
+    """
+    Reads the bcrypt cost out of a hash ("$2b$12$...").
+
+    Args:
+        hashed_password (bytes): The hashed password.
+
+    Returns:
+        int: The cost it was hashed with.
+    """
+    return int(hashed_password[4:6])
+
+
+def needs_rehash(hashed_password: Union[bytes, str]) -> bool:
+    """
+    Tells if a hash was made with a lower cost than the current one, so
+    it should be upgraded the next time the password is known. Hashes
+    with a higher cost are kept: costs only ever go up.
+
+    Args:
+        hashed_password (bytes): The hashed password.
+
+    Returns:
+        bool: True if the hash should be recomputed.
+    """
+    return hash_rounds(hashed_password) < ROUNDS
+
+
+def hash_password(password: str, rounds: int = None) -> bytes:
     """
     Hashes a password using bcrypt and returns the salted,
     hashed password as a byte string.
 
     Args:
         password (str): The password to hash.
+        rounds (int): The bcrypt cost, ROUNDS by default.
 
     Returns:
         bytes: The salted, hashed password.
     """
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt())
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds or ROUNDS))
 
 
 def is_valid(hashed_password: bytes, password: str) -> bool:
@@ -32,3 +112,79 @@ def is_valid(hashed_password: bytes, password: str) -> bool:
         bool: True if the password matches, False otherwise.
     """
     return bcrypt.checkpw(password.encode(), hashed_password)
+
+
+def _verify_pair(pair: Tuple[bytes, str]) -> bool:
+    """
+    Validates one (hashed_password, password) pair.
+
+    Args:
+        pair (tuple): The hashed password and the plain text password.
+
+    Returns:
+        bool: True if the password matches, False otherwise.
+    """
+    return is_valid(*pair)
+
+
+def _map_in_pool(func: Callable, items: Iterable, workers: int,
+                 chunksize: int) -> Iterator:
+    """
+    Applies func to every item in a process pool, yielding the results
+    in input order. The input is consumed one window of chunks at a
+    time, so an arbitrarily long iterable is never held in memory.
+
+    Args:
+        func (Callable): The module-level function to apply.
+        items (Iterable): The inputs.
+        workers (int): Number of processes, None for one per CPU.
+        chunksize (int): Items sent to a process at a time.
+
+    Yields:
+        The result of func for each item, in order.
+    """
+    items = iter(items)
+    workers = workers or os.cpu_count() or 1
+    window = chunksize * workers * 2
+    with ProcessPoolExecutor(workers) as executor:
+        while True:
+            batch = list(islice(items, window))
+            if not batch:
+                return
+            yield from executor.map(func, batch, chunksize=chunksize)
+
+
+def hash_passwords(passwords: Iterable[str], workers: int = None,
+                   chunksize: int = 64) -> Iterator[bytes]:
+    """
+    Hashes many passwords across a process pool.
+
+    Args:
+        passwords (Iterable[str]): The passwords to hash.
+        workers (int): Number of processes, one per CPU by default.
+        chunksize (int): Passwords sent to a process at a time.
+
+    Yields:
+        bytes: The salted, hashed passwords, in input order.
+    """
+    # the cost is passed along: workers started with spawn or forkserver
+    # re-import this module and would not see a calibrate() call
+    return _map_in_pool(partial(hash_password, rounds=ROUNDS), passwords,
+                        workers, chunksize)
+
+
+def verify_many(pairs: Iterable[Tuple[bytes, str]], workers: int = None,
+                chunksize: int = 64) -> Iterator[bool]:
+    """
+    Validates many (hashed_password, password) pairs across a process
+    pool.
+
+    Args:
+        pairs (Iterable[tuple]): The hashed and plain text passwords.
+        workers (int): Number of processes, one per CPU by default.
+        chunksize (int): Pairs sent to a process at a time.
+
+    Yields:
+        bool: Whether each password matches, in input order.
+    """
+    return _map_in_pool(_verify_pair, pairs, workers, chunksize)
@@ -5,15 +5,32 @@ handling, including secure access to a MySQL database using environment
 variables.
 """
 
+import atexit
 import os
 import mysql.connector
 import logging
-from typing import List
+import logging.handlers
+import queue
+import threading
+import time
+from functools import lru_cache
+from typing import Callable, List, Pattern, Tuple
 import re
 
 
 # Define the PII fields to be redacted
 PII_FIELDS = ("name", "email", "phone", "ssn", "password")
+# Rows fetched (and log lines written) at a time by main()
+BATCH_SIZE = int(os.getenv('PERSONAL_DATA_BATCH_SIZE', '1000'))
+# Connections kept by get_db() and how long an idle one may be reused
+POOL_SIZE = int(os.getenv('PERSONAL_DATA_DB_POOL_SIZE', '5'))
+POOL_IDLE_TIMEOUT = float(os.getenv('PERSONAL_DATA_DB_POOL_IDLE', '300'))
+# Seconds get_db() waits for a free connection before giving up
+POOL_TIMEOUT = float(os.getenv('PERSONAL_DATA_DB_POOL_TIMEOUT', '30'))
+# Records waiting for the logging thread before callers drop (or block)
+LOG_QUEUE_SIZE = int(os.getenv('PERSONAL_DATA_LOG_QUEUE_SIZE', '10000'))
+# Lines the logging thread writes at once when records keep coming
+LOG_BATCH_SIZE = int(os.getenv('PERSONAL_DATA_LOG_BATCH_SIZE', '100'))
 
 
 class RedactingFormatter(logging.Formatter):
@@ -35,6 +52,121 @@ class RedactingFormatter(logging.Formatter):
         return super(RedactingFormatter, self).format(record)
 
 
+@lru_cache(maxsize=64)
+def redaction_pattern(fields: Tuple[str, ...], separator: str) -> Pattern:
+    """
+    Returns a compiled regex matching any of the fields with its value,
+    so a message is redacted in a single pass. Cached per field-set and
+    separator.
+    """
+    names = "|".join(re.escape(field) for field in fields)
+    return re.compile(f'({names})=[^{re.escape(separator)}]*')
+
+
+class BufferedStreamHandler(logging.StreamHandler):
+    """ StreamHandler writing formatted records in batches """
+
+    def __init__(self, stream=None, capacity: int = BATCH_SIZE):
+        super(BufferedStreamHandler, self).__init__(stream)
+        self.capacity = capacity
+        self.buffer = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """
+        Format the record and write the buffer once it holds
+        `capacity` lines.
+        """
+        try:
+            self.buffer.append(self.format(record) + self.terminator)
+            if len(self.buffer) >= self.capacity:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self) -> None:
+        """
+        Write the buffered lines with a single write call.
+        """
+        self.acquire()
+        try:
+            if self.buffer and self.stream:
+                self.stream.write("".join(self.buffer))
+                self.buffer = []
+            super(BufferedStreamHandler, self).flush()
+        finally:
+            self.release()
+
+    def close(self) -> None:
+        """
+        Flush what is left before closing.
+        """
+        self.flush()
+        super(BufferedStreamHandler, self).close()
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """ QueueHandler feeding a bounded queue drained by a listener thread
+
+    When the queue is full a record is dropped (and counted) unless
+    `block` is set, in which case the caller waits for room.
+    """
+
+    def __init__(self, handler: logging.Handler,
+                 maxsize: int = LOG_QUEUE_SIZE, block: bool = False):
+        super(AsyncQueueHandler, self).__init__(queue.Queue(maxsize))
+        self.block = block
+        self.enqueued = 0
+        self.dropped = 0
+        self.listener = FlushingQueueListener(self.queue, handler)
+        self.listener.start()
+        atexit.register(self.close)
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """
+        Queue the record, dropping it if the queue is full and
+        `block` is not set.
+        """
+        try:
+            self.queue.put(record, block=self.block)
+            self.enqueued += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self) -> None:
+        """
+        Wait until every queued record has been written.
+        """
+        if self.listener._thread is None:
+            return
+        self.queue.join()
+        for handler in self.listener.handlers:
+            handler.flush()
+
+    def close(self) -> None:
+        """
+        Drain the queue and stop the listener thread.
+        """
+        if self.listener._thread is not None:
+            self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+        super(AsyncQueueHandler, self).close()
+
+
+class FlushingQueueListener(logging.handlers.QueueListener):
+    """ QueueListener flushing its handlers whenever the queue runs dry,
+    so buffered lines are not held back while logging is idle """
+
+    def dequeue(self, block: bool) -> logging.LogRecord:
+        """
+        Flush the handlers before waiting on an empty queue.
+        """
+        if block and self.queue.empty():
+            for handler in self.handlers:
+                handler.flush()
+        return self.queue.get(block)
+
+
 def filter_datum(fields: List[str], redaction: str, message: str,
                  separator: str) -> str:
     """
@@ -47,29 +179,188 @@ def filter_datum(fields: List[str], redaction: str, message: str,
         separator: a string representing by which character is separating
                    all fields in the log line (message)
     """
-    for field in fields:
-        message = re.sub(f'{field}=[^{separator}]*',
-                         f'{field}={redaction}', message)
-    return message
+    if not fields:
+        return message
+    pattern = redaction_pattern(tuple(fields), separator)
+    return pattern.sub(lambda m: f'{m.group(1)}={redaction}', message)
 
 
-def get_logger() -> logging.Logger:
+def get_logger(batch_size: int = LOG_BATCH_SIZE,
+               block: bool = False) -> logging.Logger:
     """
     Returns a logging.Logger object configured with a RedactingFormatter.
+
+    Records go through a bounded queue to a listener thread, which
+    redacts them and writes up to batch_size lines at once; callers
+    never wait on the stream. When the queue is full records are
+    dropped, or the caller waits if block is set.
+    The logger is configured on the first call only; later calls
+    return it unchanged, whatever their batch_size and block.
     """
     logger = logging.getLogger("user_data")
+    if any(isinstance(h, AsyncQueueHandler) for h in logger.handlers):
+        return logger
     logger.setLevel(logging.INFO)
     logger.propagate = False
-    stream_handler = logging.StreamHandler()
+    stream_handler = BufferedStreamHandler(capacity=max(batch_size, 1))
     stream_handler.setFormatter(RedactingFormatter(fields=PII_FIELDS))
-    logger.addHandler(stream_handler)
+    logger.addHandler(AsyncQueueHandler(stream_handler, block=block))
     return logger
 
 
-def get_db() -> mysql.connector.connection.MySQLConnection:
+class PoolTimeout(Exception):
+    """ Raised when no pooled connection frees up in time """
+
+
+class PooledConnection:
+    """ Connection checked out of a ConnectionPool
+
+    Behaves like the wrapped connection, except that close() hands it
+    back to the pool instead of closing it. Leaving a `with` block, or
+    the object being garbage collected without close(), does the same.
+    """
+
+    def __init__(self, pool: "ConnectionPool", conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name: str):
+        return getattr(self._conn, name)
+
+    def __enter__(self) -> "PooledConnection":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __del__(self):
+        if self.__dict__.get('_conn') is not None:
+            try:
+                self.close()
+            except Exception:
+                pass
+
+    def close(self) -> None:
+        """
+        Return the connection to its pool.
+        """
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+
+class ConnectionPool:
+    """ Bounded pool of database connections
+
+    At most `size` connections exist at once; checkout waits up to
+    `timeout` seconds when they are all in use, then raises PoolTimeout.
+    Idle connections older than `idle_timeout` seconds, or failing their
+    health check, are closed instead of reused.
+    """
+
+    def __init__(self, connect: Callable, size: int = POOL_SIZE,
+                 idle_timeout: float = POOL_IDLE_TIMEOUT,
+                 timeout: float = POOL_TIMEOUT):
+        self.connect = connect
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._idle = []
+
+    def acquire(self) -> PooledConnection:
+        """
+        Returns a healthy connection, reusing an idle one if possible.
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout("no database connection free after "
+                              "{}s".format(self.timeout))
+        try:
+            while True:
+                with self._lock:
+                    if not self._idle:
+                        break
+                    conn, released_at = self._idle.pop()
+                if time.monotonic() - released_at <= self.idle_timeout \
+                        and self._is_healthy(conn):
+                    return PooledConnection(self, conn)
+                self._close(conn)
+            return PooledConnection(self, self.connect())
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn) -> None:
+        """
+        Puts a connection back in the pool, after rolling back whatever
+        its borrower left open so the next one neither reads from the
+        same snapshot nor inherits unread results. A connection that
+        fails the rollback is closed instead.
+        """
+        try:
+            conn.rollback()
+        except Exception:
+            self._close(conn)
+            self._slots.release()
+            return
+        with self._lock:
+            self._idle.append((conn, time.monotonic()))
+        self._slots.release()
+
+    def close(self) -> None:
+        """
+        Closes every idle connection.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._close(conn)
+
+    @staticmethod
+    def _is_healthy(conn) -> bool:
+        """
+        Checks the server still answers on this connection.
+        """
+        try:
+            return conn.is_connected()
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close(conn) -> None:
+        """
+        Closes a connection, ignoring errors from dead ones.
+        """
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_db() -> PooledConnection:
     """
     Returns a MySQL database connection object using environment
     variables for credentials.
+
+    Connections come from a shared ConnectionPool; closing the returned
+    object (or leaving a `with get_db() as db:` block) gives it back to
+    the pool.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(connect_db)
+    return _pool.acquire()
+
+
+def connect_db() -> mysql.connector.connection.MySQLConnection:
+    """
+    Opens a new MySQL connection using environment variables for
+    credentials.
     """
     username = os.getenv('PERSONAL_DATA_DB_USERNAME', 'root')
     password = os.getenv('PERSONAL_DATA_DB_PASSWORD', '')
@@ -84,23 +375,45 @@ def get_db() -> mysql.connector.connection.MySQLConnection:
     )
 
 
-def main():
+def main(batch_size: int = BATCH_SIZE):
     """
     Retrieves and displays rows from the 'users' table with filtered output.
+
+    Rows are streamed from an unbuffered cursor batch_size at a time and
+    the log lines are written batch_size at a time, so memory use does
+    not depend on the size of the table.
     """
     db = get_db()
-    cursor = db.cursor()
+    cursor = db.cursor(buffered=False)
     cursor.execute("SELECT * FROM users;")
-    logger = get_logger()
-
-    for row in cursor:
-        msg = f"name={row[0]}; email={row[1]}; phone={row[2]}; " \
-              f"ssn={row[3]}; password={row[4]}; ip={row[5]}; " \
-              f"last_login={row[6]}; user_agent={row[7]};"
-        logger.info(msg)
+    logger = get_logger(batch_size, block=True)
+    # an earlier get_logger() call may have set up a dropping handler:
+    # the export must not lose rows, so wait for room while it runs
+    queue_handlers = [h for h in logger.handlers
+                      if isinstance(h, AsyncQueueHandler)]
+    previous_block = [h.block for h in queue_handlers]
+    for handler in queue_handlers:
+        handler.block = True
 
-    cursor.close()
-    db.close()
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                msg = f"name={row[0]}; email={row[1]}; phone={row[2]}; " \
+                      f"ssn={row[3]}; password={row[4]}; ip={row[5]}; " \
+                      f"last_login={row[6]}; user_agent={row[7]};"
+                logger.info(msg)
+    finally:
+        for handler in logger.handlers:
+            handler.flush()
+        for handler, block in zip(queue_handlers, previous_block):
+            handler.block = block
+        try:
+            cursor.close()
+        finally:
+            db.close()
 
 
 if __name__ == "__main__":
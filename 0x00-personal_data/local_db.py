@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+This module provides an in-memory stand-in for a mysql.connector
+connection, so get_db() users and the connection pool can be exercised
+without a MySQL server:
+
+    import filtered_logger
+    from local_db import LocalConnection
+    filtered_logger._pool = filtered_logger.ConnectionPool(LocalConnection)
+"""
+
+import sqlite3
+from typing import Iterable, Tuple
+
+
+USERS_COLUMNS = ("name", "email", "phone", "ssn", "password", "ip",
+                 "last_login", "user_agent")
+
+
+class LocalConnection:
+    """ SQLite-backed connection with the mysql.connector calls we use """
+    opened = 0
+
+    def __init__(self, rows: Iterable[Tuple] = ()):
+        self._db = sqlite3.connect(":memory:", check_same_thread=False)
+        self._db.execute("CREATE TABLE users ({})".format(
+            ", ".join(USERS_COLUMNS)))
+        self._db.executemany("INSERT INTO users VALUES ({})".format(
+            ", ".join("?" * len(USERS_COLUMNS))), rows)
+        self.connected = True
+        LocalConnection.opened += 1
+
+    def cursor(self, buffered: bool = None, **kwargs) -> sqlite3.Cursor:
+        """
+        Returns a cursor; buffering options are accepted and ignored.
+        """
+        return self._db.cursor()
+
+    def is_connected(self) -> bool:
+        """
+        Returns False once the connection was closed.
+        """
+        return self.connected
+
+    def rollback(self) -> None:
+        """
+        Rolls back the current transaction.
+        """
+        self._db.rollback()
+
+    def close(self) -> None:
+        """
+        Closes the connection.
+        """
+        self.connected = False
+        self._db.close()
@@ -2,7 +2,33 @@
 """ API authentication
 """
 from flask import request
-from typing import List, TypeVar
+from functools import lru_cache
+from typing import List, Pattern, Tuple, TypeVar
+import re
+
+
+@lru_cache(maxsize=32)
+def compile_excluded_paths(excluded_paths: Tuple[str]) -> Pattern:
+    """ compile excluded paths into a single regex
+
+    A trailing '*' matches any suffix, other paths match with or
+    without their trailing slash.
+    """
+    patterns = []
+    for p in excluded_paths:
+        if p.endswith('*'):
+            patterns.append(re.escape(p[:-1]) + '.*')
+        else:
+            if not p.endswith('/'):
+                p += '/'
+            patterns.append(re.escape(p))
+    return re.compile('|'.join(patterns))
+
+
+@lru_cache(maxsize=1024)
+def is_excluded_path(pattern: Pattern, path: str) -> bool:
+    """ check (and remember) if a slash-terminated path is excluded"""
+    return pattern.fullmatch(path) is not None
 
 
 class Auth():
@@ -13,11 +39,8 @@ class Auth():
             return True
         if path[-1] != '/':
             path += '/'
-        for p in excluded_paths:
-            if p.endswith('*'):
-                if path.startswith(p[:1]):
-                    return False
-        return False if path in excluded_paths else True
+        pattern = compile_excluded_paths(tuple(excluded_paths))
+        return not is_excluded_path(pattern, path)
 
     def authorization_header(self, request=None) -> str:
         """ authorization header check"""
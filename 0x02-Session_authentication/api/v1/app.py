@@ -4,8 +4,10 @@ Route module for the API
 """
 from os import getenv
 from api.v1.views import app_views
-from flask import Flask, jsonify, abort, request
+from flask import Flask, jsonify, abort, request, g
 from flask_cors import (CORS, cross_origin)
+import threading
+import time
 
 
 app = Flask(__name__)
@@ -28,6 +30,15 @@ elif getenv('AUTH_TYPE') == 'session_exp_auth':
 elif getenv('AUTH_TYPE') == 'session_db_auth':
     from api.v1.auth.session_db_auth import SessionDBAuth
     auth = SessionDBAuth()
+# requests whose user was resolved or rejected, and the time spent on it
+auth_stats = {'resolved': 0, 'rejected': 0,
+              'resolved_time': 0.0, 'rejected_time': 0.0}
+auth_stats_lock = threading.Lock()
+# views read these from current_app.extensions: under `python3 -m
+# api.v1.app`, `from api.v1.app import` loads a second copy of this module
+app.extensions['auth'] = auth
+app.extensions['auth_stats'] = auth_stats
+app.extensions['auth_stats_lock'] = auth_stats_lock
 
 
 @app.errorhandler(404)
@@ -57,13 +68,33 @@ def before_request():
     """
     excluded_paths = ['/api/v1/status/', '/api/v1/unauthorized/',
                       '/api/v1/forbidden/', '/api/v1/auth_session/login/']
+    request.current_user = None
     if auth and auth.require_auth(request.path, excluded_paths):
         if (not auth.authorization_header(request) and
                 not auth.session_cookie(request)):
             abort(401)
-        if not auth.current_user(request):
+        start = time.perf_counter()
+        user = auth.current_user(request)
+        g.auth_time = time.perf_counter() - start
+        outcome = 'resolved' if user else 'rejected'
+        with auth_stats_lock:
+            auth_stats[outcome] += 1
+            auth_stats[outcome + '_time'] += g.auth_time
+        if not user:
             abort(403)
-        request.current_user = auth.current_user(request)
+        g.current_user = user
+        request.current_user = user
+
+
+@app.after_request
+def after_request(response):
+    """ After request: report the time spent resolving the user
+    """
+    auth_time = g.get('auth_time')
+    if auth_time is not None:
+        response.headers['Server-Timing'] = 'auth;dur={:.3f}'.format(
+            auth_time * 1000)
+    return response
 
 
 if __name__ == "__main__":
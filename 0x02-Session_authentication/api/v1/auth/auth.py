@@ -5,8 +5,35 @@ manage API authentication
 
 
 from flask import request
-from typing import List, TypeVar
+from functools import lru_cache
+from typing import List, Pattern, Tuple, TypeVar
 from os import getenv
+import re
+
+
+@lru_cache(maxsize=32)
+def compile_excluded_paths(excluded_paths: Tuple[str]) -> Pattern:
+    """Compile excluded paths into a single regex
+
+    A trailing '*' matches any suffix, other paths match with or
+    without their trailing slash.
+    """
+    patterns = []
+    for p in excluded_paths:
+        if p.endswith('*'):
+            patterns.append(re.escape(p[:-1]) + '.*')
+        else:
+            if not p.endswith('/'):
+                p += '/'
+            patterns.append(re.escape(p))
+    return re.compile('|'.join(patterns))
+
+
+@lru_cache(maxsize=1024)
+def is_excluded_path(pattern: Pattern, path: str) -> bool:
+    """Check (and remember) if a slash-terminated path is excluded
+    """
+    return pattern.fullmatch(path) is not None
 
 
 class Auth:
@@ -19,10 +46,8 @@ class Auth:
             return True
         if path[-1] != '/':
             path += '/'
-        for p in excluded_paths:
-            if path[:p.find('*')] in p[:p.find('*')]:
-                return False
-        return True
+        pattern = compile_excluded_paths(tuple(excluded_paths))
+        return not is_excluded_path(pattern, path)
 
     def authorization_header(self, request=None) -> str:
         """Return authorization header
@@ -3,12 +3,25 @@
 from flask import request
 from typing import List, TypeVar
 from api.v1.auth.auth import Auth
+from collections import OrderedDict
 from models.user import User
+from os import getenv
 import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
 
 
 class BasicAuth(Auth):
     """BasicAuth Class"""
+    cache_size = int(getenv('BASIC_AUTH_CACHE_SIZE', '1024'))
+    cache_ttl = int(getenv('BASIC_AUTH_CACHE_TTL', '60'))
+    _cache_key = os.urandom(32)
+    _cache = OrderedDict()
+    _cache_lock = threading.Lock()
+
     def extract_base64_authorization_header(self,
                                             authorization_header: str
                                             ) -> str:
@@ -66,9 +79,56 @@ class BasicAuth(Auth):
         """
         try:
             header = self.authorization_header(request)
+            user = self.cached_user(header)
+            if user:
+                return user
             base64_h = self.extract_base64_authorization_header(header)
             decode_h = self.decode_base64_authorization_header(base64_h)
             credents = self.extract_user_credentials(decode_h)
-            return self.user_object_from_credentials(credents[0], credents[1])
+            user = self.user_object_from_credentials(credents[0], credents[1])
+            if user:
+                self.cache_user(header, user)
+            return user
         except Exception:
             return None
+
+    def _cache_digest(self, authorization_header: str) -> bytes:
+        """keyed hash of the header, so raw credentials are never kept"""
+        return hmac.new(self._cache_key, authorization_header.encode(),
+                        hashlib.sha256).digest()
+
+    def cached_user(self, authorization_header: str) -> TypeVar('User'):
+        """returns the User previously verified for this exact header,
+        unless the entry expired or the user was removed or changed
+        password since
+        """
+        if not isinstance(authorization_header, str) or self.cache_size <= 0:
+            return None
+        digest = self._cache_digest(authorization_header)
+        with self._cache_lock:
+            entry = self._cache.get(digest)
+            if entry is None:
+                return None
+            user_id, password, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._cache[digest]
+                return None
+            self._cache.move_to_end(digest)
+        user = User.get(user_id)
+        if user is None or user.password != password:
+            with self._cache_lock:
+                self._cache.pop(digest, None)
+            return None
+        return user
+
+    def cache_user(self, authorization_header: str, user: TypeVar('User')):
+        """remembers the User verified for this header"""
+        if self.cache_size <= 0:
+            return
+        digest = self._cache_digest(authorization_header)
+        entry = (user.id, user.password, time.monotonic() + self.cache_ttl)
+        with self._cache_lock:
+            self._cache[digest] = entry
+            self._cache.move_to_end(digest)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+RedisSessionStore class to share session IDs between processes
+"""
+from datetime import datetime
+import json
+import queue
+import socket
+import socketserver
+import threading
+import time
+
+
+def _encode_value(value) -> bytes:
+    """Serialize a session value, keeping datetimes
+    """
+    def default(obj):
+        if isinstance(obj, datetime):
+            return {'__datetime__': obj.isoformat()}
+        raise TypeError
+    return json.dumps(value, default=default).encode()
+
+
+def _decode_value(data: bytes):
+    """Deserialize a session value
+    """
+    def object_hook(obj):
+        if '__datetime__' in obj:
+            return datetime.fromisoformat(obj['__datetime__'])
+        return obj
+    return json.loads(data, object_hook=object_hook)
+
+
+class _Connection:
+    """One socket speaking the Redis protocol (RESP)
+    """
+
+    def __init__(self, host: str, port: int, db: int, timeout: float):
+        """Connect and select the database
+        """
+        self.sock = socket.create_connection((host, port), timeout)
+        self.file = self.sock.makefile('rb')
+        if db:
+            self.execute([('SELECT', db)])
+
+    def execute(self, commands: list) -> list:
+        """Send all commands in one write, then read one reply each
+        """
+        out = []
+        for command in commands:
+            out.append(b'*%d\r\n' % len(command))
+            for arg in command:
+                if not isinstance(arg, bytes):
+                    arg = str(arg).encode()
+                out.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        self.sock.sendall(b''.join(out))
+        return [self.read_reply() for _ in commands]
+
+    def read_reply(self):
+        """Read one RESP reply
+        """
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("connection closed by server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode()
+        if kind == b'-':
+            raise RuntimeError(rest.decode())
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            size = int(rest)
+            if size < 0:
+                return None
+            return self.file.read(size + 2)[:-2]
+        if kind == b'*':
+            size = int(rest)
+            if size < 0:
+                return None
+            return [self.read_reply() for _ in range(size)]
+        raise RuntimeError("bad reply: {!r}".format(line))
+
+    def close(self):
+        """Close the socket
+        """
+        try:
+            self.file.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisSessionStore:
+    """Session ID -> value map kept in a Redis-compatible server
+
+    Same interface as SessionStore, so every worker process (and host)
+    sees the sessions created by the others. Expiry is left to the
+    server; connections are pooled and reused between calls.
+    """
+
+    def __init__(self, host: str = 'localhost', port: int = 6379,
+                 db: int = 0, prefix: str = 'session:',
+                 pool_size: int = 8, timeout: float = 5):
+        """Initialize RedisSessionStore
+        """
+        self.host = host
+        self.port = port
+        self.db = db
+        self.prefix = prefix
+        self.timeout = timeout
+        self.__pool = queue.LifoQueue(maxsize=pool_size)
+
+    def _execute(self, *commands) -> list:
+        """Run commands as one pipeline on a pooled connection
+        """
+        try:
+            conn = self.__pool.get_nowait()
+        except queue.Empty:
+            conn = _Connection(self.host, self.port, self.db, self.timeout)
+        try:
+            replies = conn.execute(list(commands))
+        except BaseException:
+            # error replies and protocol errors too: later pipelined
+            # replies may be left unread, so the connection is not reused
+            conn.close()
+            raise
+        try:
+            self.__pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+        return replies
+
+    def set(self, session_id: str, value, ttl: int = None):
+        """Store a value, expiring after ttl seconds if ttl is given
+        """
+        command = ('SET', self.prefix + session_id, _encode_value(value))
+        if ttl is not None and ttl > 0:
+            command += ('EX', ttl)
+        self._execute(command)
+
+    def __setitem__(self, session_id: str, value):
+        """Store a value without expiry
+        """
+        self.set(session_id, value)
+
+    def get(self, session_id: str, default=None):
+        """Return the value of a live session
+        """
+        data, = self._execute(('GET', self.prefix + session_id))
+        return default if data is None else _decode_value(data)
+
+    def pop(self, session_id: str, default=None):
+        """Remove a session and return its value
+        """
+        key = self.prefix + session_id
+        data, _ = self._execute(('GET', key), ('DEL', key))
+        return default if data is None else _decode_value(data)
+
+    def __contains__(self, session_id: str) -> bool:
+        """Check if a session is live
+        """
+        return self.get(session_id) is not None
+
+    def __len__(self) -> int:
+        """Number of keys in the selected database, sessions or not
+        """
+        return self._execute(('DBSIZE',))[0]
+
+    def stats(self) -> dict:
+        """Number of keys in the selected database (DBSIZE: other keys
+        than sessions count too; expiry and eviction are server-side)
+        """
+        return {'db_keys': len(self)}
+
+
+class LocalRedisServer(socketserver.ThreadingTCPServer):
+    """In-process stand-in for a Redis server, for local runs
+
+    Understands the few commands RedisSessionStore sends:
+    PING, SELECT, SET [EX], GET, DEL, DBSIZE.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        """Bind the server; port 0 picks a free port
+        """
+        super().__init__((host, port), _LocalRedisHandler)
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def start(self) -> int:
+        """Serve from a daemon thread and return the bound port
+        """
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.server_address[1]
+
+    def run(self, command: list) -> bytes:
+        """Execute one command and return the encoded reply
+        """
+        name = command[0].upper()
+        now = time.monotonic()
+        with self.lock:
+            if name in (b'PING', b'SELECT'):
+                return b'+OK\r\n' if name == b'SELECT' else b'+PONG\r\n'
+            if name == b'SET':
+                expires_at = None
+                if len(command) == 5 and command[3].upper() == b'EX':
+                    expires_at = now + int(command[4])
+                self.data[command[1]] = (command[2], expires_at)
+                return b'+OK\r\n'
+            if name == b'GET':
+                entry = self.data.get(command[1])
+                if entry is None or (entry[1] is not None and
+                                     entry[1] <= now):
+                    self.data.pop(command[1], None)
+                    return b'$-1\r\n'
+                return b'$%d\r\n%s\r\n' % (len(entry[0]), entry[0])
+            if name == b'DEL':
+                count = sum(self.data.pop(k, None) is not None
+                            for k in command[1:])
+                return b':%d\r\n' % count
+            if name == b'DBSIZE':
+                return b':%d\r\n' % len(self.data)
+        return b'-ERR unknown command\r\n'
+
+
+class _LocalRedisHandler(socketserver.StreamRequestHandler):
+    """Connection handler of LocalRedisServer
+    """
+
+    def handle(self):
+        """Read RESP arrays and answer them until the client leaves
+        """
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = []
+            for _ in range(int(line[1:-2])):
+                size = int(self.rfile.readline()[1:-2])
+                command.append(self.rfile.read(size + 2)[:-2])
+            self.wfile.write(self.server.run(command))
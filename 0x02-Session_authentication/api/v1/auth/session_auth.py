@@ -3,13 +3,29 @@
 
 
 from api.v1.auth.auth import Auth
+from api.v1.auth.session_store import SessionStore
 from models.user import User
+from os import getenv
 import uuid
 
 
+def session_store():
+    """ session store selected by the SESSION_STORE env variable """
+    if getenv('SESSION_STORE') == 'redis':
+        from api.v1.auth.redis_session_store import RedisSessionStore
+        return RedisSessionStore(
+            host=getenv('REDIS_HOST', 'localhost'),
+            port=int(getenv('REDIS_PORT', '6379')),
+            db=int(getenv('REDIS_DB', '0')),
+            pool_size=int(getenv('REDIS_POOL_SIZE', '8')))
+    return SessionStore(
+        max_size=int(getenv('SESSION_MAX_COUNT', '100000')),
+        sweep_interval=int(getenv('SESSION_SWEEP_INTERVAL', '60')))
+
+
 class SessionAuth (Auth):
     """ SessionAuth class to manage API authentication """
-    user_id_by_session_id = {}
+    user_id_by_session_id = session_store()
 
     def create_session(self, user_id: str = None) -> str:
         """ create a Session ID for a user_id """
@@ -19,7 +19,6 @@ class SessionDBAuth(SessionExpAuth):
             session_id = super().create_session(user_id)
             us = UserSession(user_id=user_id, session_id=session_id)
             us.save()
-            UserSession.save_to_file()
             return session_id
 
     def user_id_for_session_id(self, session_id=None):
@@ -27,7 +26,7 @@ class SessionDBAuth(SessionExpAuth):
         """
         if not session_id:
             return None
-        UserSession.load_from_file()
+        UserSession.reload_from_file()
         users = UserSession.search({'session_id': session_id})
         for u in users:
             delta = timedelta(seconds=self.session_duration)
@@ -47,6 +46,5 @@ class SessionDBAuth(SessionExpAuth):
             users = UserSession.search({'session_id': session_id})
             for u in users:
                 u.remove()
-                UserSession.save_to_file()
                 return True
         return False
@@ -24,8 +24,9 @@ class SessionExpAuth(SessionAuth):
         """
         session_id = super().create_session(user_id)
         if session_id:
-            SessionAuth.user_id_by_session_id[session_id] = {
-                'user_id': user_id, 'created_at': datetime.now()}
+            SessionAuth.user_id_by_session_id.set(session_id, {
+                'user_id': user_id, 'created_at': datetime.now()},
+                self.session_duration)
             return session_id
 
     def user_id_for_session_id(self, session_id=None):
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+SessionStore class to keep session IDs in memory
+"""
+from collections import OrderedDict
+import heapq
+import threading
+import time
+
+
+class SessionStore:
+    """Bounded map of session ID -> value with optional expiry
+
+    Entries with a TTL are pushed on a heap ordered by expiry time, which
+    a background thread pops every `sweep_interval` seconds. When more
+    than `max_size` sessions are live, the least recently used one is
+    evicted.
+    """
+
+    def __init__(self, max_size: int = 0, sweep_interval: int = 60):
+        """Initialize SessionStore
+        """
+        self.max_size = max_size
+        self.sweep_interval = sweep_interval
+        self.expired = 0
+        self.evicted = 0
+        self.__data = OrderedDict()
+        self.__heap = []
+        self.__lock = threading.Lock()
+        self.__sweeper = None
+
+    def set(self, session_id: str, value, ttl: int = None):
+        """Store a value, expiring after ttl seconds if ttl is given
+        """
+        expires_at = None
+        if ttl is not None and ttl > 0:
+            expires_at = time.monotonic() + ttl
+        with self.__lock:
+            self.__data[session_id] = (value, expires_at)
+            self.__data.move_to_end(session_id)
+            if expires_at is not None:
+                heapq.heappush(self.__heap, (expires_at, session_id))
+            while self.max_size > 0 and len(self.__data) > self.max_size:
+                self.__data.popitem(last=False)
+                self.evicted += 1
+        if expires_at is not None:
+            self._start_sweeper()
+
+    def __setitem__(self, session_id: str, value):
+        """Store a value without expiry
+        """
+        self.set(session_id, value)
+
+    def get(self, session_id: str, default=None):
+        """Return the value of a live session
+        """
+        with self.__lock:
+            entry = self.__data.get(session_id)
+            if entry is None:
+                return default
+            if entry[1] is not None and entry[1] <= time.monotonic():
+                del self.__data[session_id]
+                self.expired += 1
+                return default
+            self.__data.move_to_end(session_id)
+            return entry[0]
+
+    def pop(self, session_id: str, default=None):
+        """Remove a session and return its value
+        """
+        with self.__lock:
+            entry = self.__data.pop(session_id, None)
+        return default if entry is None else entry[0]
+
+    def __contains__(self, session_id: str) -> bool:
+        """Check if a session is live
+        """
+        return self.get(session_id) is not None
+
+    def __len__(self) -> int:
+        """Number of stored sessions (expired ones not swept yet included)
+        """
+        return len(self.__data)
+
+    def sweep(self) -> int:
+        """Drop every expired session and return how many were dropped
+        """
+        now = time.monotonic()
+        count = 0
+        with self.__lock:
+            while self.__heap and self.__heap[0][0] <= now:
+                expires_at, session_id = heapq.heappop(self.__heap)
+                entry = self.__data.get(session_id)
+                # the heap keeps stale entries of replaced sessions
+                if entry is not None and entry[1] == expires_at:
+                    del self.__data[session_id]
+                    count += 1
+            self.expired += count
+        return count
+
+    def stats(self) -> dict:
+        """Counters of live, expired and evicted sessions
+        """
+        return {'live': len(self.__data), 'expired': self.expired,
+                'evicted': self.evicted}
+
+    def _start_sweeper(self):
+        """Start the background sweeper thread once
+        """
+        if self.__sweeper is not None or self.sweep_interval <= 0:
+            return
+        with self.__lock:
+            if self.__sweeper is not None:
+                return
+            self.__sweeper = threading.Thread(target=self._sweep_forever,
+                                              daemon=True)
+        self.__sweeper.start()
+
+    def _sweep_forever(self):
+        """Body of the sweeper thread
+        """
+        while True:
+            time.sleep(self.sweep_interval)
+            self.sweep()
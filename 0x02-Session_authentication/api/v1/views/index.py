@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """ Module of Index views
 """
-from flask import jsonify, abort
+from flask import jsonify, abort, current_app
 from api.v1.views import app_views
 
 
@@ -21,8 +21,13 @@ def stats() -> str:
       - the number of each objects
     """
     from models.user import User
+    auth = current_app.extensions['auth']
     stats = {}
     stats['users'] = User.count()
+    with current_app.extensions['auth_stats_lock']:
+        stats['auth'] = dict(current_app.extensions['auth_stats'])
+    if hasattr(auth, 'user_id_by_session_id'):
+        stats['sessions'] = auth.user_id_by_session_id.stats()
     return jsonify(stats)
 
 
@@ -2,16 +2,53 @@
 """ Module of Users views
 """
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from flask import Response, abort, jsonify, request
 from models.user import User
+from urllib.parse import urlencode
+import json
+
+PAGE_MAX_LIMIT = 1000
 
 
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters (optional):
+      - limit: number of Users per page, turns pagination on
+      - after: ID of the last User of the previous page
+      - format=ndjson: stream all Users, one JSON object per line
     Return:
       - list of all User objects JSON represented
+      - with limit/after: one page of them ordered by ID, and a Link
+        header to the next page when there may be one
+      - with format=ndjson: all of them as an NDJSON stream
+      - 400 if limit isn't an integer between 1 and 1000
     """
+    if request.args.get('format') == 'ndjson':
+        def generate():
+            after = None
+            while True:
+                users = User.page(after, PAGE_MAX_LIMIT)
+                if not users:
+                    return
+                for user in users:
+                    yield json.dumps(user.to_json()) + "\n"
+                after = users[-1].id
+        return Response(generate(), mimetype='application/x-ndjson')
+    if 'limit' in request.args or 'after' in request.args:
+        try:
+            limit = int(request.args.get('limit', 100))
+        except ValueError:
+            limit = 0
+        if limit < 1 or limit > PAGE_MAX_LIMIT:
+            return jsonify({'error': "Wrong limit"}), 400
+        users = User.page(request.args.get('after'), limit)
+        out = jsonify([user.to_json() for user in users])
+        if len(users) == limit:
+            query = urlencode({'limit': limit, 'after': users[-1].id})
+            out.headers['Link'] = '<{}?{}>; rel="next"'.format(
+                request.base_url, query)
+        return out
     all_users = [user.to_json() for user in User.all()]
     return jsonify(all_users)
 
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+""" Benchmark of User.load_from_file startup time
+
+Usage: ./benchmark_load.py [number of users, default 1000000]
+"""
+from datetime import datetime
+from models.base import TIMESTAMP_FORMAT
+from models.user import User
+import json
+import os
+import sys
+import tempfile
+import time
+
+
+def main(count: int = 1000000):
+    """ Write `count` users to a snapshot file, then time loading it:
+    lazily, with every timestamp parsed afterwards, and the strptime
+    calls the previous eager loading paid for
+    """
+    os.chdir(tempfile.mkdtemp())
+    now = datetime.utcnow().strftime(TIMESTAMP_FORMAT)
+    with open(".db_User.json", 'w') as f:
+        json.dump({str(i): {'id': str(i), 'created_at': now,
+                            'updated_at': now, 'email': "{}@x.io".format(i),
+                            '_password': None, 'first_name': None,
+                            'last_name': None}
+                   for i in range(count)}, f)
+
+    start = time.perf_counter()
+    User.load_from_file()
+    loaded = time.perf_counter() - start
+    print("load_from_file (lazy): {:.2f}s".format(loaded))
+
+    start = time.perf_counter()
+    for user in User.all():
+        user.created_at, user.updated_at
+    print("+ parse every timestamp: {:.2f}s".format(
+        time.perf_counter() - start))
+
+    start = time.perf_counter()
+    for _ in range(count):
+        datetime.strptime(now, TIMESTAMP_FORMAT)
+        datetime.strptime(now, TIMESTAMP_FORMAT)
+    print("previous eager strptime alone: {:.2f}s".format(
+        time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+""" Benchmark of the memory used per User and UserSession row, with the
+regular models and with BASE_COMPACT_MODELS=1
+
+Usage: ./benchmark_memory.py [number of rows, default 100000]
+"""
+import os
+import subprocess
+import sys
+import tracemalloc
+
+
+def measure(count: int):
+    """ Print the bytes per row of `count` loaded Users and UserSessions
+    in the current mode
+    """
+    from models.base import DATA
+    from models.user import User
+    from models.user_session import UserSession
+
+    now = "2024-01-01T00:00:00"
+    for cls, fields in ((User, {'email': "{}@x.io", '_password': "{:064x}",
+                                'first_name': None, 'last_name': None}),
+                        (UserSession, {'user_id': "{:036d}",
+                                       'session_id': "{:036x}"})):
+        DATA[cls.__name__] = {}
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for i in range(count):
+            kwargs = {k: v if v is None else v.format(i)
+                      for k, v in fields.items()}
+            obj = cls(id="{:036d}".format(i), created_at=now,
+                      updated_at=now, **kwargs)
+            DATA[cls.__name__][obj.id] = obj
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print("  {}: {:.0f} bytes/row".format(
+            cls.__name__, (after - before) / count))
+
+
+def main(count: int = 100000):
+    """ Run measure() with and without compact models
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    for compact in ('0', '1'):
+        print("BASE_COMPACT_MODELS={}".format(compact))
+        sys.stdout.flush()
+        env = dict(os.environ, BASE_COMPACT_MODELS=compact)
+        subprocess.run([sys.executable, __file__, '--measure', str(count)],
+                       env=env, cwd=here, check=True)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ['--measure']:
+        measure(int(sys.argv[2]))
+    else:
+        main(*(int(arg) for arg in sys.argv[1:]))
@@ -1,12 +1,15 @@
 #!/usr/bin/env python3
 """ UserSession module
 """
-from models.base import Base
+from models.base import Base, COMPACT_MODELS
 
 
 class UserSession(Base):
     """ UserSession class
     """
+    if COMPACT_MODELS:
+        __slots__ = ('user_id', 'session_id')
+    indexed_attributes = ('session_id',)
 
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a UserSession instance
@@ -2,13 +2,30 @@
 """
 Flask app
 """
-from auth import Auth
+from auth import Auth, HashingBusy
 from flask import Flask, jsonify, request, abort, redirect
 
 AUTH = Auth()
 app = Flask(__name__)
 
 
+@app.errorhandler(HashingBusy)
+def hashing_busy(error) -> str:
+    """Too many password hashes queued
+
+    Returns:
+        str: json error with status 503
+    """
+    return jsonify({"error": "Service Unavailable"}), 503
+
+
+@app.teardown_appcontext
+def close_db_session(exception) -> None:
+    """Release the database session of the request thread
+    """
+    AUTH.close_session()
+
+
 @app.route('/', methods=['GET'], strict_slashes=False)
 def hello() -> str:
     """GET route index
@@ -31,6 +48,8 @@ def user() -> str:
     try:
         AUTH.register_user(email, password)
         return jsonify({"email": f"{email}", "message": "user created"}), 200
+    except HashingBusy:
+        raise
     except Exception:
         return jsonify({"messege": "email already registered"}), 400
 
@@ -92,12 +111,11 @@ def get_reset_password_token() -> str:
        str: message
     """
     email = request.form.get('email')
-    user = AUTH.create_session(email)
-    if not user:
-        abort(403)
-    else:
+    try:
         token = AUTH.get_reset_password_token(email)
-        return jsonify({"email": f"{email}", "reset_token": f"{token}"})
+    except ValueError:
+        abort(403)
+    return jsonify({"email": f"{email}", "reset_token": f"{token}"})
 
 
 @app.route('/reset_password', methods=['PUT'], strict_slashes=False)
@@ -114,6 +132,8 @@ def update_password() -> str:
         AUTH.update_password(reset_token, new_psw)
         return jsonify({"email": f"{email}",
                         "message": "Password updated"}), 200
+    except HashingBusy:
+        raise
     except Exception:
         abort(403)
 
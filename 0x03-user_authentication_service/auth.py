@@ -2,12 +2,167 @@
 """
 Auth module
 """
-from db import DB
+from db import DB, CREATED, EXISTS, INVALID
 from uuid import uuid4
 from user import User
 from bcrypt import hashpw, gensalt, checkpw
-from typing import TypeVar
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
+from os import getenv
+from typing import Callable, Iterable, List, NamedTuple, Tuple, Union
 from sqlalchemy.orm.exc import NoResultFound
+import math
+import threading
+import time
+
+
+class SessionUser(NamedTuple):
+    """user of a session, as returned by get_user_from_session_id
+    """
+    id: int
+    email: str
+    session_id: str
+
+
+class HashingBusy(Exception):
+    """Raised when too many password hashes are already queued
+    """
+
+
+class HashPool:
+    """Process pool running bcrypt off the request threads
+
+    At most `max_pending` hashes may be queued or running at once;
+    past that `run` raises HashingBusy instead of waiting.
+    With `workers` set to 0 hashes run inline on the caller's thread,
+    a negative value uses one process per CPU.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """create the worker processes on first use
+
+        Returns:
+            ProcessPoolExecutor: the pool
+        """
+        with self._lock:
+            if self._executor is None:
+                workers = self.workers if self.workers > 0 else None
+                self._executor = ProcessPoolExecutor(workers)
+            return self._executor
+
+    def run(self, func: Callable, *args):
+        """run func(*args) in the pool and wait for its result
+
+        Args:
+            func (Callable): module-level function to run
+
+        Raises:
+            HashingBusy: if the queue is full
+
+        Returns:
+            the result of func
+        """
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy
+        try:
+            if self.workers == 0:
+                return func(*args)
+            return self._get_executor().submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+    def map(self, func: Callable, *iterables, chunksize: int = 1) -> list:
+        """run func over iterables in the pool and wait for all results
+
+        Meant for batch jobs: unlike run it doesn't count against
+        max_pending, so a large import is never turned away.
+
+        Args:
+            func (Callable): module-level function to run
+            chunksize (int): calls sent to a worker at once
+
+        Returns:
+            list: the results of func, in order
+        """
+        if self.workers == 0:
+            return list(map(func, *iterables))
+        return list(self._get_executor().map(func, *iterables,
+                                             chunksize=chunksize))
+
+
+HASH_POOL = HashPool(int(getenv('HASH_WORKERS', '-1')),
+                     int(getenv('HASH_MAX_PENDING', '64')))
+# bcrypt cost of new hashes; Auth() recalibrates it when
+# BCRYPT_TARGET_MS is set
+BCRYPT_ROUNDS = int(getenv('BCRYPT_ROUNDS', '12'))
+BCRYPT_MIN_ROUNDS = int(getenv('BCRYPT_MIN_ROUNDS', '10'))
+BCRYPT_MAX_ROUNDS = int(getenv('BCRYPT_MAX_ROUNDS', '16'))
+
+
+def calibrate_rounds(target_ms: float) -> int:
+    """highest bcrypt cost hashing within target_ms on this machine
+
+    Each extra round doubles the time, so one hash at BCRYPT_MIN_ROUNDS
+    is timed and extrapolated.
+
+    Args:
+        target_ms (float): time budget of one hash in milliseconds
+
+    Returns:
+        int: bcrypt cost between BCRYPT_MIN_ROUNDS and BCRYPT_MAX_ROUNDS
+    """
+    start = time.perf_counter()
+    hashpw(b"calibration", gensalt(BCRYPT_MIN_ROUNDS))
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if elapsed_ms <= 0 or elapsed_ms >= target_ms:
+        return BCRYPT_MIN_ROUNDS
+    rounds = BCRYPT_MIN_ROUNDS + int(math.log2(target_ms / elapsed_ms))
+    return max(BCRYPT_MIN_ROUNDS, min(rounds, BCRYPT_MAX_ROUNDS))
+
+
+def _hash_rounds(hashed_password: Union[bytes, str]) -> int:
+    """bcrypt cost of a hash ("$2b$12$...")
+
+    Args:
+        hashed_password (bytes): stored hash
+
+    Returns:
+        int: cost it was hashed with
+    """
+    return int(hashed_password[4:6])
+
+
+def _hashpw(password: bytes, rounds: int) -> bytes:
+    """hash a password with a new salt (runs in the hash pool)
+
+    Args:
+        password (bytes): encoded password
+        rounds (int): bcrypt cost
+
+    Returns:
+        bytes: password hashed
+    """
+    return hashpw(password, gensalt(rounds))
+
+
+def _checkpw(password: bytes, hashed_password: bytes) -> bool:
+    """check a password against a hash (runs in the hash pool)
+
+    Args:
+        password (bytes): encoded password
+        hashed_password (bytes): stored hash
+
+    Returns:
+        bool: True if they match
+    """
+    return checkpw(password, hashed_password)
 
 
 def _hash_password(password: str) -> str:
@@ -19,7 +174,7 @@ def _hash_password(password: str) -> str:
     Returns:
         str: password hashed
     """
-    return hashpw(password.encode('utf-8'), gensalt())
+    return HASH_POOL.run(_hashpw, password.encode('utf-8'), BCRYPT_ROUNDS)
 
 
 def _generate_uuid() -> str:
@@ -33,10 +188,51 @@ def _generate_uuid() -> str:
 
 class Auth:
     """Auth class to interact with the authentication database.
+
+    get_user_from_session_id keeps up to SESSION_CACHE_SIZE sessions in
+    memory for SESSION_CACHE_TTL seconds. Sessions changed through this
+    instance are invalidated at once; changes made by other processes
+    show up once the entry expires.
+
+    The database is opened on first use, not in __init__: hash pool
+    workers started with spawn or forkserver re-import the main module
+    (app.py, which builds an Auth) and must not reset the users table.
     """
+    cache_size = int(getenv('SESSION_CACHE_SIZE', '1024'))
+    cache_ttl = int(getenv('SESSION_CACHE_TTL', '60'))
 
     def __init__(self):
-        self._db = DB()
+        global BCRYPT_ROUNDS
+        self.__db = None
+        self.__db_lock = threading.Lock()
+        # session_id -> (SessionUser, expiry); user id -> session_id
+        self._cache = OrderedDict()
+        self._cached_sessions = {}
+        self._cache_lock = threading.Lock()
+        self._cache_generation = 0
+        self._cache_counts = {'hits': 0, 'misses': 0, 'expired': 0,
+                              'evicted': 0, 'invalidated': 0}
+        target_ms = getenv('BCRYPT_TARGET_MS')
+        if target_ms:
+            BCRYPT_ROUNDS = calibrate_rounds(float(target_ms))
+
+    @property
+    def _db(self) -> DB:
+        """database, created on first use
+
+        Returns:
+            DB: the database
+        """
+        if self.__db is None:
+            with self.__db_lock:
+                if self.__db is None:
+                    self.__db = DB()
+        return self.__db
+
+    def close_session(self) -> None:
+        """release the database session of the current thread
+        """
+        self._db.close_session()
 
     def register_user(self, email: str, password: str) -> User:
         """register a user
@@ -54,6 +250,51 @@ class Auth:
         except NoResultFound:
             return self._db.add_user(email, _hash_password(password))
 
+    def register_users(self, users: Iterable[Tuple[str, str]],
+                       rounds: int = None,
+                       chunk_size: int = 500) -> List[str]:
+        """register many users at once
+
+        Each chunk is checked against the table in one query, so only new
+        emails get hashed; their passwords are hashed in parallel in the
+        hash pool, then inserted in one transaction by DB.add_users.
+
+        Args:
+            users (Iterable): (email, password) pairs
+            rounds (int): bcrypt cost, BCRYPT_ROUNDS by default. A cheaper
+                cost makes large imports faster; valid_login upgrades each
+                hash at the user's first login
+            chunk_size (int): users per transaction
+
+        Returns:
+            List[str]: outcome of each pair, CREATED, EXISTS or INVALID
+        """
+        rounds = rounds or BCRYPT_ROUNDS
+        outcomes = []
+        users = iter(users)
+        while True:
+            chunk = list(islice(users, chunk_size))
+            if not chunk:
+                return outcomes
+            existing = self._db.existing_emails(
+                email for email, _ in chunk if email)
+            new = {}
+            chunk_outcomes = []
+            for email, password in chunk:
+                if not email or not password:
+                    chunk_outcomes.append(INVALID)
+                elif email in existing or email in new:
+                    chunk_outcomes.append(EXISTS)
+                else:
+                    new[email] = password.encode('utf-8')
+                    chunk_outcomes.append(None)
+            hashes = HASH_POOL.map(_hashpw, new.values(), repeat(rounds),
+                                   chunksize=16)
+            added = iter(self._db.add_users(zip(new, hashes), len(new),
+                                            checked=True))
+            outcomes.extend(outcome or next(added)
+                            for outcome in chunk_outcomes)
+
     def valid_login(self, email: str, password: str) -> bool:
         """valid login of user
 
@@ -68,7 +309,18 @@ class Auth:
             user = self._db.find_user_by(email=email)
         except NoResultFound:
             return False
-        return checkpw(password.encode('utf-8'), user.hash_password)
+        if not HASH_POOL.run(_checkpw, password.encode('utf-8'),
+                             user.hashed_password):
+            return False
+        if _hash_rounds(user.hashed_password) < BCRYPT_ROUNDS:
+            # hashed with a lower cost: upgrade it now we know the password;
+            # never downgrade, even when this host calibrated lower
+            try:
+                self._db.update_user(user.id,
+                                     hashed_password=_hash_password(password))
+            except HashingBusy:
+                pass
+        return True
 
     def create_session(self, email: str) -> str:
         """create a new session for user
@@ -85,23 +337,107 @@ class Auth:
             self._db.update_user(user.id, session_id=session_id)
         except NoResultFound:
             return
+        self._uncache_user(user.id)
+        return session_id
 
-    def get_user_from_session_id(self, session_id: str) -> str:
-        """get user from session id
+    def get_user_from_session_id(self, session_id: str) -> SessionUser:
+        """get user from session id, from the cache when possible
 
         Args:
             session_id (str): session id of user
 
         Returns:
-            str: user email
+            SessionUser: id, email and session_id of the user, or None;
+            the same on a cache hit and a miss
         """
         if session_id is None:
             return
+        user = self._cached_user(session_id)
+        if user is not None:
+            return user
+        generation = self._cache_generation
         try:
-            user = self._db.find_user_by(session_id=session_id)
-            return user.email
+            found = self._db.find_user_by(session_id=session_id)
         except NoResultFound:
             return
+        user = SessionUser(found.id, found.email, session_id)
+        self._cache_user(user, generation)
+        return user
+
+    def _cached_user(self, session_id: str) -> SessionUser:
+        """user cached for session_id
+
+        Args:
+            session_id (str): session id of user
+
+        Returns:
+            SessionUser: the cached user, or None
+        """
+        with self._cache_lock:
+            entry = self._cache.get(session_id)
+            if entry is None:
+                self._cache_counts['misses'] += 1
+                return None
+            user, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._cache[session_id]
+                self._cached_sessions.pop(user.id, None)
+                self._cache_counts['expired'] += 1
+                self._cache_counts['misses'] += 1
+                return None
+            self._cache.move_to_end(session_id)
+            self._cache_counts['hits'] += 1
+        return user
+
+    def _cache_user(self, user: SessionUser, generation: int) -> None:
+        """remember the user of a session
+
+        Args:
+            user (SessionUser): user found in the database
+            generation (int): _cache_generation before the lookup; if an
+                invalidation happened since, the user may be stale
+        """
+        if self.cache_size <= 0:
+            return
+        entry = (user, time.monotonic() + self.cache_ttl)
+        with self._cache_lock:
+            if generation != self._cache_generation:
+                return
+            old_session_id = self._cached_sessions.get(user.id)
+            if old_session_id is not None:
+                self._cache.pop(old_session_id, None)
+            self._cache[user.session_id] = entry
+            self._cached_sessions[user.id] = user.session_id
+            while len(self._cache) > self.cache_size:
+                _, (evicted, _) = self._cache.popitem(last=False)
+                del self._cached_sessions[evicted.id]
+                self._cache_counts['evicted'] += 1
+
+    def _uncache_user(self, user_id: int) -> None:
+        """forget the cached session of a user
+
+        Args:
+            user_id (int): user id
+        """
+        with self._cache_lock:
+            self._cache_generation += 1
+            session_id = self._cached_sessions.pop(user_id, None)
+            if session_id is not None:
+                del self._cache[session_id]
+                self._cache_counts['invalidated'] += 1
+
+    def cache_stats(self) -> dict:
+        """counters of the session cache
+
+        Returns:
+            dict: hits, misses, hit_rate, size, expired, evicted and
+            invalidated entries
+        """
+        with self._cache_lock:
+            stats = dict(self._cache_counts, size=len(self._cache))
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
 
     def destroy_session(self, user_id: int) -> None:
         """destroy session
@@ -110,10 +446,10 @@ class Auth:
             user_id (int): user id
         """
         try:
-            user = self._db.find_user_by(id=user_id)
-            self._db.update_user(user.id, session_id=None)
+            self._db.update_user(user_id, session_id=None)
         except NoResultFound:
             pass
+        self._uncache_user(user_id)
 
     def get_reset_password_token(self, email: str) -> str:
         """get reset password token
@@ -152,3 +488,4 @@ class Auth:
                                  reset_token=None)
         except NoResultFound:
             raise ValueError
+        self._uncache_user(user.id)
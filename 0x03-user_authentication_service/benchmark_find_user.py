@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Benchmark of DB.find_user_by latency on a large users table,
+with and without the indexes declared on User
+
+Usage: ./benchmark_find_user.py [number of users, default 1000000]
+"""
+import os
+import sys
+import tempfile
+import time
+from uuid import uuid4
+
+
+def time_lookups(db, rows: list, lookups: int = 200) -> dict:
+    """time find_user_by on email, session_id and reset_token
+
+    Args:
+        db (DB): database to query
+        rows (list): rows inserted in the users table
+        lookups (int): number of lookups per column
+
+    Returns:
+        dict: average milliseconds per lookup, by column
+    """
+    step = max(len(rows) // lookups, 1)
+    result = {}
+    for column in ('email', 'session_id', 'reset_token'):
+        start = time.perf_counter()
+        for row in rows[::step][:lookups]:
+            db.find_user_by(**{column: row[column]})
+        result[column] = (time.perf_counter() - start) * 1000 / lookups
+    return result
+
+
+def main(count: int = 1000000) -> None:
+    """fill a users table with count rows, then time lookups before and
+    after DB.migrate() builds the indexes
+
+    Args:
+        count (int): number of users
+    """
+    path = os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+    os.environ['AUTH_DB_URL'] = 'sqlite:///{}'.format(path)
+    from db import DB
+    from user import User
+
+    db = DB()
+    rows = [{'email': 'user{}@example.com'.format(i),
+             'hashed_password': 'x' * 60,
+             'session_id': str(uuid4()),
+             'reset_token': str(uuid4())} for i in range(count)]
+    with db._engine.begin() as conn:
+        for index in User.__table__.indexes:
+            conn.execute('DROP INDEX IF EXISTS {}'.format(index.name))
+        conn.execute(User.__table__.insert(), rows)
+
+    for label in ('without indexes', 'with indexes'):
+        if label == 'with indexes':
+            start = time.perf_counter()
+            db.migrate()
+            print('migrate: {:.1f}s'.format(time.perf_counter() - start))
+        timings = time_lookups(db, rows)
+        print('{} ({} users): {}'.format(label, count, ', '.join(
+            '{} {:.3f} ms'.format(k, v) for k, v in timings.items())))
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
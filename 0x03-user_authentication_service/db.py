@@ -3,32 +3,110 @@
 BD class
 """
 
-from sqlalchemy import create_engine
-from sqlalchemy.exc import InvalidRequestError
+from itertools import islice
+from os import getenv
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.exc import IntegrityError, InvalidRequestError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.orm.exc import NoResultFound
-from typing import TypeVar
+from sqlalchemy.pool import QueuePool
+from typing import Iterable, List, Set, Tuple, TypeVar
 from user import Base, User
 
 
 DATA = ['id', 'email', 'hashed_password', 'session_id', 'reset_token']
+# outcomes of each row of add_users / Auth.register_users
+CREATED = 'created'
+EXISTS = 'exists'
+INVALID = 'invalid'
+# bound parameters per IN query, under SQLite's default limit of 999
+IN_CHUNK_SIZE = 500
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """turn on WAL mode for every new SQLite connection
+
+    Args:
+        dbapi_connection: sqlite3 connection just opened
+        connection_record: pool record of the connection
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
 
 
 class DB:
+    """DB class
+
+    By default the tables of a.db are dropped and recreated on every
+    instantiation. When AUTH_DB_URL is set (any SQLAlchemy URL) the
+    existing data is kept and connections come from a pool sized by
+    AUTH_DB_POOL_SIZE and AUTH_DB_MAX_OVERFLOW; SQLite files run in WAL
+    mode.
+    Each thread gets its own session; close_session() ends it.
+    """
 
     def __init__(self):
-        self._engine = create_engine("sqlite:///a.db", echo=False)
-        Base.metadata.drop_all(self._engine)
+        """initialize the engine and the session registry
+        """
+        url = getenv('AUTH_DB_URL')
+        if url is None:
+            self._engine = create_engine("sqlite:///a.db", echo=False)
+            Base.metadata.drop_all(self._engine)
+        else:
+            self._engine = self._create_engine(url)
         Base.metadata.create_all(self._engine)
-        self.__session = None
+        self.migrate()
+        self.__session = scoped_session(sessionmaker(bind=self._engine))
+
+    @staticmethod
+    def _create_engine(url: str):
+        """create a pooled engine for a persistent database
+
+        Args:
+            url (str): SQLAlchemy database URL
+
+        Returns:
+            Engine: engine bound to the database
+        """
+        options = {'echo': False, 'pool_pre_ping': True,
+                   'pool_size': int(getenv('AUTH_DB_POOL_SIZE', '5')),
+                   'max_overflow': int(getenv('AUTH_DB_MAX_OVERFLOW', '10'))}
+        if url.startswith('sqlite'):
+            # pooled connections are handed to whichever thread needs one
+            options['connect_args'] = {'check_same_thread': False}
+            options['poolclass'] = QueuePool
+        engine = create_engine(url, **options)
+        if url.startswith('sqlite'):
+            event.listen(engine, 'connect', _sqlite_pragmas)
+        return engine
+
+    def migrate(self) -> None:
+        """add the indexes declared on User that an existing users
+        table (created before they were declared) is missing
+
+        Raises:
+            IntegrityError: if a unique index can't be built because
+                of duplicated values
+        """
+        existing = {index['name']
+                    for index in inspect(self._engine).get_indexes('users')}
+        for index in User.__table__.indexes:
+            if index.name not in existing:
+                index.create(bind=self._engine)
 
     @property
     def _session(self):
-        if self.__session is None:
-            DBSession = sessionmaker(bind=self._engine)
-            self.__session = DBSession()
-        return self.__session
+        """session of the current thread
+        """
+        return self.__session()
+
+    def close_session(self) -> None:
+        """end the session of the current thread (request teardown)
+        """
+        self.__session.remove()
 
     def add_user(self, email: str, hashed_password: str) -> User:
         """add user to database
@@ -47,6 +125,96 @@ class DB:
         session.commit()
         return user
 
+    def existing_emails(self, emails: Iterable[str]) -> Set[str]:
+        """emails already in the users table
+
+        Args:
+            emails (Iterable): emails to look up
+
+        Returns:
+            Set[str]: the ones found
+        """
+        found = set()
+        emails = iter(emails)
+        while True:
+            chunk = list(islice(emails, IN_CHUNK_SIZE))
+            if not chunk:
+                return found
+            found.update(email for email, in self._session.query(
+                User.email).filter(User.email.in_(chunk)))
+
+    def add_users(self, users: Iterable[Tuple[str, str]],
+                  chunk_size: int = 500, checked: bool = False) -> List[str]:
+        """add many users, one transaction and one executemany per
+        chunk of rows
+
+        Args:
+            users (Iterable): (email, hashed_password) pairs
+            chunk_size (int): rows per transaction
+            checked (bool): the caller already dropped the emails found
+                by existing_emails, so don't look them up again; an email
+                registered meanwhile is still reported as EXISTS
+
+        Returns:
+            List[str]: outcome of each pair, CREATED, EXISTS (already
+            in the table or earlier in users) or INVALID (empty email or
+            password)
+        """
+        outcomes = []
+        users = iter(users)
+        while True:
+            chunk = list(islice(users, chunk_size))
+            if not chunk:
+                return outcomes
+            outcomes.extend(self._add_chunk(chunk, checked))
+
+    def _add_chunk(self, chunk: List[Tuple[str, str]],
+                   checked: bool = False) -> List[str]:
+        """insert one chunk of add_users in a single transaction
+
+        Args:
+            chunk (List): (email, hashed_password) pairs
+            checked (bool): skip the existing_emails query
+
+        Returns:
+            List[str]: outcome of each pair
+        """
+        existing = set() if checked else self.existing_emails(
+            email for email, _ in chunk if email)
+        outcomes = []
+        rows = {}
+        for email, hashed_password in chunk:
+            if not email or not hashed_password:
+                outcomes.append(INVALID)
+            elif email in existing or email in rows:
+                outcomes.append(EXISTS)
+            else:
+                rows[email] = {'email': email,
+                               'hashed_password': hashed_password}
+                outcomes.append(CREATED)
+        if not rows:
+            return outcomes
+        session = self._session
+        insert = User.__table__.insert()
+        try:
+            session.execute(insert, list(rows.values()))
+            session.commit()
+        except IntegrityError:
+            # another writer registered one of the emails meanwhile:
+            # fall back to one row per transaction for this chunk
+            session.rollback()
+            for email, row in rows.items():
+                try:
+                    session.execute(insert, row)
+                    session.commit()
+                except IntegrityError:
+                    session.rollback()
+                    rows[email] = None
+            outcomes = [EXISTS if outcome == CREATED and
+                        rows[email] is None else outcome
+                        for (email, _), outcome in zip(chunk, outcomes)]
+        return outcomes
+
     def find_user_by(self, **kwargs) -> User:
         """find user by some arguments
 
@@ -58,16 +226,29 @@ class DB:
             raise NoResultFound
         return user
 
-    def update_user(self, user_id: int, **kwargs) -> None:
-        """Update user
+    def update_user(self, user_id: int, **kwargs) -> int:
+        """Update user with a single UPDATE statement
 
         Args:
             user_id (int): id of user
+
+        Raises:
+            ValueError: if an argument isn't a column of users
+            NoResultFound: if no user has this id
+
+        Returns:
+            int: number of rows updated
         """
-        user = self.find_user_by(id=user_id)
-        for key, val in kwargs.items():
+        for key in kwargs:
             if key not in DATA:
                 raise ValueError
-            setattr(user, key, val)
-        self._session.commit()
-        return None
+        if not kwargs:
+            self.find_user_by(id=user_id)
+            return 0
+        session = self._session
+        count = session.query(User).filter_by(id=user_id).update(
+            kwargs, synchronize_session=False)
+        session.commit()
+        if count == 0:
+            raise NoResultFound
+        return count
@@ -1,20 +1,100 @@
 #!/usr/bin/env python3
 """ Base module
 """
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager
 from datetime import datetime
 from typing import TypeVar, List, Iterable
-from os import path
-import json
+from models import fast_json
+from os import getenv, path
+import os
+import threading
 import uuid
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
 DATA = {}
+INDEXES = {}
+JOURNAL_MODE = getenv('BASE_STORAGE') == 'journal'
+JOURNAL_COMPACT_SIZE = int(getenv('BASE_JOURNAL_COMPACT_SIZE', '1000'))
+JOURNALS = {}
+FILE_STAMPS = {}
+# class name -> [thread lock, open lock file, depth]
+FILE_LOCKS = {}
+_file_locks_guard = threading.Lock()
+STORAGE = None
+if getenv('BASE_STORAGE') == 'sqlite':
+    from models.sqlite_storage import SQLiteStorage
+    STORAGE = SQLiteStorage(getenv('BASE_SQLITE_PATH', '.db.sqlite3'))
+COMPACT_MODELS = getenv('BASE_COMPACT_MODELS') == '1'
+SERIALIZERS = {}
+SLOTS = {}
+
+
+def parse_timestamp(value: str) -> datetime:
+    """ Parse a TIMESTAMP_FORMAT string, much faster than strptime
+    """
+    return datetime.fromisoformat(value)
+
+
+class Timestamp():
+    """ Datetime attribute that may hold its TIMESTAMP_FORMAT string,
+    parsed on first access: objects loaded from storage don't pay for
+    parsing dates nobody reads, and serialize them back as-is
+
+    The value lives in the instance __dict__, or in the slot `member`
+    for classes using __slots__.
+    """
+
+    def __init__(self, name: str, member=None):
+        """ Initialize a Timestamp attribute
+        """
+        self.name = name
+        self.member = member
+
+    def raw(self, obj):
+        """ Return the stored value, datetime or string
+        """
+        if self.member is not None:
+            return self.member.__get__(obj)
+        try:
+            return obj.__dict__[self.name]
+        except KeyError:
+            raise AttributeError(self.name)
+
+    def __get__(self, obj, objtype=None) -> datetime:
+        """ Return the datetime, parsing the raw string if needed
+        """
+        if obj is None:
+            return self
+        value = self.raw(obj)
+        if type(value) is str:
+            value = parse_timestamp(value)
+            self.__set__(obj, value)
+        return value
+
+    def __set__(self, obj, value):
+        """ Store a datetime or a TIMESTAMP_FORMAT string
+        """
+        if self.member is not None:
+            self.member.__set__(obj, value)
+        else:
+            obj.__dict__[self.name] = value
 
 
 class Base():
     """ Base class
+
+    With BASE_COMPACT_MODELS=1, Base and the models declare __slots__
+    instead of carrying a __dict__ per instance.
     """
+    if COMPACT_MODELS:
+        __slots__ = ('id', 'created_at', 'updated_at')
+    indexed_attributes = ()
 
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
@@ -23,15 +103,16 @@ class Base():
         if DATA.get(s_class) is None:
             DATA[s_class] = {}
 
-        self.id = kwargs.get('id', str(uuid.uuid4()))
+        if 'id' in kwargs:
+            self.id = kwargs['id']
+        else:
+            self.id = str(uuid.uuid4())
         if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
+            self.created_at = kwargs.get('created_at')
         else:
             self.created_at = datetime.utcnow()
         if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
+            self.updated_at = kwargs.get('updated_at')
         else:
             self.updated_at = datetime.utcnow()
 
@@ -47,64 +128,261 @@ class Base():
     def to_json(self, for_serialization: bool = False) -> dict:
         """ Convert the object a JSON dictionary
         """
+        attrs = self._attributes()
+        serializer = SERIALIZERS.get(self.__class__)
+        if serializer is None or attrs.keys() != serializer[0]:
+            serializer = self.__class__._compile_serializer(attrs)
         result = {}
-        for key, value in self.__dict__.items():
-            if not for_serialization and key[0] == '_':
-                continue
+        for key in serializer[2] if for_serialization else serializer[1]:
+            value = attrs[key]
+            # checked on every object: an attribute may be None on one
+            # and a datetime on the next
             if type(value) is datetime:
-                result[key] = value.strftime(TIMESTAMP_FORMAT)
-            else:
-                result[key] = value
+                # same output as strftime(TIMESTAMP_FORMAT), much faster
+                value = value.isoformat(timespec='seconds')
+            result[key] = value
         return result
 
+    def _attributes(self) -> dict:
+        """ Attribute name -> stored value (timestamps left unparsed)
+        """
+        try:
+            return self.__dict__
+        except AttributeError:
+            pass
+        cls = self.__class__
+        members = SLOTS.get(cls)
+        if members is None:
+            members = []
+            for klass in reversed(cls.__mro__):
+                for name in klass.__dict__.get('__slots__', ()):
+                    member = getattr(cls, name)
+                    if isinstance(member, Timestamp):
+                        member = member.member
+                    members.append((name, member))
+            SLOTS[cls] = members
+        attrs = {}
+        for name, member in members:
+            try:
+                attrs[name] = member.__get__(self)
+            except AttributeError:
+                continue
+        return attrs
+
+    @classmethod
+    def _compile_serializer(cls, attrs: dict) -> tuple:
+        """ Compute once the key lists to_json needs for objects of the
+        class holding these attributes
+        """
+        serializer = (
+            frozenset(attrs),
+            tuple(k for k in attrs if k[0] != '_'),
+            tuple(attrs)
+        )
+        SERIALIZERS[cls] = serializer
+        return serializer
+
     @classmethod
     def load_from_file(cls):
-        """ Load all objects from file
+        """ Load all objects from file, then replay the journal on top
         """
+        if STORAGE is not None:
+            STORAGE.load(cls)
+            return
         s_class = cls.__name__
         file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
+        with cls._file_lock():
+            DATA[s_class] = {}
+            JOURNALS[s_class] = 0
+            FILE_STAMPS[s_class] = cls._file_stamp()
+            if path.exists(file_path):
+                with open(file_path, 'r') as f:
+                    objs_json = fast_json.loads(f.read())
+                    for obj_id, obj_json in objs_json.items():
+                        DATA[s_class][obj_id] = cls(**obj_json)
+            cls._replay_journal()
+            cls._build_indexes()
+
+    @classmethod
+    def reload_from_file(cls):
+        """ Load all objects from file, unless the files haven't changed
+        since this process last read or wrote them
+        """
+        if STORAGE is not None:
+            return
+        s_class = cls.__name__
+        if s_class in FILE_STAMPS and \
+                FILE_STAMPS[s_class] == cls._file_stamp():
             return
+        cls.load_from_file()
+
+    @classmethod
+    @contextmanager
+    def _file_lock(cls):
+        """ Hold the class's lock file (flock, where available) so only one
+        process at a time reads then rewrites or appends to its files
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+        Reentrant within a thread; other threads of the process wait.
+        """
+        s_class = cls.__name__
+        with _file_locks_guard:
+            lock = FILE_LOCKS.setdefault(s_class, [threading.RLock(), None, 0])
+        with lock[0]:
+            if lock[2] == 0 and fcntl is not None:
+                lock[1] = open(".db_{}.lock".format(s_class), 'a')
+                fcntl.flock(lock[1], fcntl.LOCK_EX)
+            lock[2] += 1
+            try:
+                yield
+            finally:
+                lock[2] -= 1
+                if lock[2] == 0 and lock[1] is not None:
+                    # closing the file releases the flock
+                    lock[1].close()
+                    lock[1] = None
+
+    @classmethod
+    def _file_stamp(cls) -> tuple:
+        """ (inode, mtime, size) of the snapshot and journal files
+        """
+        s_class = cls.__name__
+        stamp = []
+        for ext in ('json', 'journal'):
+            try:
+                st = os.stat(".db_{}.{}".format(s_class, ext))
+                stamp.append((st.st_ino, st.st_mtime_ns, st.st_size))
+            except OSError:
+                stamp.append(None)
+        return tuple(stamp)
 
     @classmethod
     def save_to_file(cls):
         """ Save all objects to file
         """
+        if STORAGE is not None:
+            return
         s_class = cls.__name__
         file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        with cls._file_lock():
+            if s_class in FILE_STAMPS:
+                # records other processes wrote since our last read
+                # would be lost in the truncated journal otherwise
+                cls.reload_from_file()
+            before = cls._file_stamp()
+            objs_json = {}
+            for obj_id, obj in DATA[s_class].items():
+                objs_json[obj_id] = obj.to_json(True)
+
+            tmp_path = "{}.tmp".format(file_path)
+            with open(tmp_path, 'w') as f:
+                f.write(fast_json.dumps(objs_json))
+            os.replace(tmp_path, file_path)
+            journal_path = ".db_{}.journal".format(s_class)
+            if JOURNAL_MODE or path.exists(journal_path):
+                # the snapshot now holds every journal record, outside of
+                # journal mode too: they must never be replayed over it
+                open(journal_path, 'w').close()
+            JOURNALS[s_class] = 0
+            if FILE_STAMPS.get(s_class) == before:
+                FILE_STAMPS[s_class] = cls._file_stamp()
+            else:
+                # another process wrote in between: reload on next check
+                FILE_STAMPS[s_class] = None
+
+    @classmethod
+    def _replay_journal(cls):
+        """ Apply the journal records written since the last snapshot
+        """
+        s_class = cls.__name__
+        journal_path = ".db_{}.journal".format(s_class)
+        if not path.exists(journal_path):
+            return
+        with open(journal_path, 'r') as f:
+            for line in f:
+                try:
+                    record = fast_json.loads(line)
+                except ValueError:
+                    # torn write at the tail: fold what we have into a
+                    # fresh snapshot so later appends start on a clean line
+                    cls.save_to_file()
+                    break
+                if record['op'] == 'save':
+                    DATA[s_class][record['id']] = cls(**record['obj'])
+                else:
+                    DATA[s_class].pop(record['id'], None)
+                JOURNALS[s_class] += 1
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+    @classmethod
+    def _append_journal(cls, op: str, obj_id: str, obj_json: dict = None):
+        """ Append one mutation to the journal, compacting it into the
+        snapshot file once it grows past JOURNAL_COMPACT_SIZE records
+        """
+        s_class = cls.__name__
+        record = {'op': op, 'id': obj_id}
+        if obj_json is not None:
+            record['obj'] = obj_json
+        line = fast_json.dumps(record) + "\n"
+        before = cls._file_stamp()
+        with open(".db_{}.journal".format(s_class), 'a') as f:
+            f.write(line)
+        after = cls._file_stamp()
+        size = before[1][2] if before[1] is not None else 0
+        if FILE_STAMPS.get(s_class) == before and after[0] == before[0] \
+                and after[1] is not None \
+                and after[1][2] == size + len(line.encode()):
+            FILE_STAMPS[s_class] = after
+        else:
+            # another process appended or compacted around our record:
+            # keep the stamp stale so the next check reloads everything
+            FILE_STAMPS[s_class] = None
+        JOURNALS[s_class] = JOURNALS.get(s_class, 0) + 1
+        if JOURNALS[s_class] >= JOURNAL_COMPACT_SIZE:
+            cls.save_to_file()
 
     def save(self):
         """ Save current object
         """
         s_class = self.__class__.__name__
         self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        if STORAGE is not None:
+            STORAGE.save(self)
+            return
+        with self.__class__._file_lock():
+            if s_class in FILE_STAMPS:
+                # pick up other processes' writes before adding ours
+                self.__class__.reload_from_file()
+            DATA[s_class][self.id] = self
+            self._index()
+            if JOURNAL_MODE:
+                self.__class__._append_journal('save', self.id,
+                                               self.to_json(True))
+            else:
+                self.__class__.save_to_file()
 
     def remove(self):
         """ Remove object
         """
+        if STORAGE is not None:
+            STORAGE.remove(self)
+            return
         s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        with self.__class__._file_lock():
+            if s_class in FILE_STAMPS:
+                self.__class__.reload_from_file()
+            if DATA[s_class].get(self.id) is not None:
+                del DATA[s_class][self.id]
+                self._unindex()
+                if JOURNAL_MODE:
+                    self.__class__._append_journal('remove', self.id)
+                else:
+                    self.__class__.save_to_file()
 
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
+        if STORAGE is not None:
+            return STORAGE.count(cls)
         s_class = cls.__name__
         return len(DATA[s_class].keys())
 
@@ -118,6 +396,8 @@ class Base():
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
+        if STORAGE is not None:
+            return STORAGE.get(cls, id)
         s_class = cls.__name__
         return DATA[s_class].get(id)
 
@@ -125,6 +405,8 @@ class Base():
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
         """
+        if STORAGE is not None:
+            return STORAGE.search(cls, attributes)
         s_class = cls.__name__
         def _search(obj):
             if len(attributes) == 0:
@@ -133,5 +415,103 @@ class Base():
                 if (getattr(obj, k) != v):
                     return False
             return True
-        
-        return list(filter(_search, DATA[s_class].values()))
+
+        objs = DATA[s_class]
+        if INDEXES.get(s_class) is None:
+            cls._build_indexes()
+        for k, v in attributes.items():
+            if k not in cls.indexed_attributes:
+                continue
+            try:
+                ids = INDEXES[s_class]['values'][k].get(v, ())
+            except TypeError:
+                continue
+            if len(ids) > 1:
+                # several matches: same order as DATA, callers take the first
+                ids = sorted(ids, key=INDEXES[s_class]['seq'].__getitem__)
+            return list(filter(_search, (objs[i] for i in ids)))
+        return list(filter(_search, objs.values()))
+
+    @classmethod
+    def page(cls, after: str = None,
+             limit: int = 100) -> List[TypeVar('Base')]:
+        """ Return up to `limit` objects ordered by ID, starting after
+        the ID `after` (from the start when None)
+        """
+        if STORAGE is not None:
+            return STORAGE.page(cls, after, limit)
+        s_class = cls.__name__
+        if INDEXES.get(s_class) is None:
+            cls._build_indexes()
+        order = INDEXES[s_class]['order']
+        start = 0 if after is None else bisect_right(order, after)
+        return [DATA[s_class][i] for i in order[start:start + limit]]
+
+    @classmethod
+    def _build_indexes(cls):
+        """ Rebuild the attribute indexes of the class from DATA
+        """
+        s_class = cls.__name__
+        INDEXES[s_class] = {
+            'values': {k: {} for k in cls.indexed_attributes},
+            'keys': {},
+            'seq': {},
+            'next_seq': 0,
+            'order': None
+        }
+        for obj in DATA[s_class].values():
+            obj._index()
+        INDEXES[s_class]['order'] = sorted(DATA[s_class])
+
+    def _index(self):
+        """ Add (or refresh) the object in the attribute indexes
+        """
+        s_class = self.__class__.__name__
+        if INDEXES.get(s_class) is None:
+            self.__class__._build_indexes()
+            return
+        index = INDEXES[s_class]
+        if self.id in index['keys']:
+            self._unindex(keep_order=True)
+        else:
+            # position of the object in DATA, which keeps it on updates
+            index['seq'][self.id] = index['next_seq']
+            index['next_seq'] += 1
+            if index['order'] is not None:
+                insort(index['order'], self.id)
+        keys = {}
+        for k in self.__class__.indexed_attributes:
+            v = getattr(self, k, None)
+            try:
+                # a dict as an insertion-ordered set
+                index['values'][k].setdefault(v, {})[self.id] = None
+            except TypeError:
+                continue
+            keys[k] = v
+        index['keys'][self.id] = keys
+
+    def _unindex(self, keep_order: bool = False):
+        """ Remove the object from the attribute indexes
+        """
+        index = INDEXES.get(self.__class__.__name__)
+        if index is None:
+            return
+        order = index['order']
+        if not keep_order and order is not None:
+            i = bisect_left(order, self.id)
+            if i < len(order) and order[i] == self.id:
+                del order[i]
+        if not keep_order:
+            index['seq'].pop(self.id, None)
+        keys = index['keys'].pop(self.id, {})
+        for k, v in keys.items():
+            ids = index['values'][k].get(v)
+            if ids is None:
+                continue
+            ids.pop(self.id, None)
+            if not ids:
+                del index['values'][k][v]
+
+
+for _name in ('created_at', 'updated_at'):
+    setattr(Base, _name, Timestamp(_name, Base.__dict__.get(_name)))
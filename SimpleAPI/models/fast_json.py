@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+""" JSON backend module
+
+Uses orjson when it is installed, the standard json module otherwise.
+"""
+import json
+
+try:
+    import orjson
+
+    def dumps(obj) -> str:
+        """ Serialize obj to a JSON string
+        """
+        return orjson.dumps(obj).decode()
+
+    loads = orjson.loads
+except ImportError:
+    dumps = json.dumps
+    loads = json.loads
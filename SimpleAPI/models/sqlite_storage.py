@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+""" SQLite storage module
+"""
+from models import fast_json
+from typing import TypeVar, List
+import os
+import sqlite3
+import threading
+
+
+class SQLiteStorage():
+    """ SQLite backend for Base
+
+    Every class gets its own table with the object serialized in a `data`
+    column, plus one indexed column per name in `indexed_attributes` so
+    equality searches on them are answered by SQLite.
+    The database runs in WAL mode so several worker processes can read
+    while one of them writes.
+    """
+
+    def __init__(self, file_path: str):
+        """ Initialize a SQLiteStorage instance
+        """
+        self.file_path = file_path
+        self.__local = threading.local()
+        self.__tables = set()
+        self.__inherited = []
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """ Connection of the current thread
+        """
+        conn = getattr(self.__local, 'conn', None)
+        if conn is not None and self.__local.pid != os.getpid():
+            # opened before a fork (gunicorn --preload imports the app
+            # first): SQLite connections must not cross fork(), and even
+            # closing it here could drop the parent's locks, so keep a
+            # reference and never touch it again
+            self.__inherited.append(conn)
+            conn = None
+        if conn is None:
+            conn = sqlite3.connect(self.file_path, timeout=30,
+                                   isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.__local.conn = conn
+            self.__local.pid = os.getpid()
+        return conn
+
+    def _table(self, cls) -> str:
+        """ Create the table of the class if needed and return its name
+        """
+        table = cls.__name__
+        if table in self.__tables:
+            return table
+        columns = "".join(', "{}"'.format(k) for k in cls.indexed_attributes)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS "{}" '
+            '(id TEXT PRIMARY KEY, data TEXT NOT NULL{})'
+            .format(table, columns))
+        for k in cls.indexed_attributes:
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS "ix_{0}_{1}" ON "{0}" ("{1}")'
+                .format(table, k))
+        self.__tables.add(table)
+        return table
+
+    def load(self, cls):
+        """ Make sure the class has a table
+        """
+        self._table(cls)
+
+    def save(self, obj: TypeVar('Base')):
+        """ Insert or replace one object
+        """
+        cls = obj.__class__
+        table = self._table(cls)
+        columns = "".join(', "{}"'.format(k) for k in cls.indexed_attributes)
+        marks = ", ?" * len(cls.indexed_attributes)
+        values = [obj.id, fast_json.dumps(obj.to_json(True))]
+        values += [getattr(obj, k, None) for k in cls.indexed_attributes]
+        self._conn.execute(
+            'INSERT OR REPLACE INTO "{}" (id, data{}) VALUES (?, ?{})'
+            .format(table, columns, marks), values)
+
+    def remove(self, obj: TypeVar('Base')):
+        """ Delete one object
+        """
+        table = self._table(obj.__class__)
+        self._conn.execute('DELETE FROM "{}" WHERE id = ?'.format(table),
+                           (obj.id,))
+
+    def count(self, cls) -> int:
+        """ Number of objects of the class
+        """
+        table = self._table(cls)
+        return self._conn.execute(
+            'SELECT COUNT(*) FROM "{}"'.format(table)).fetchone()[0]
+
+    def get(self, cls, id: str) -> TypeVar('Base'):
+        """ One object by ID, or None
+        """
+        table = self._table(cls)
+        row = self._conn.execute(
+            'SELECT data FROM "{}" WHERE id = ?'.format(table),
+            (id,)).fetchone()
+        if row is None:
+            return None
+        return cls(**fast_json.loads(row[0]))
+
+    def page(self, cls, after: str = None,
+             limit: int = 100) -> List[TypeVar('Base')]:
+        """ Up to `limit` objects ordered by ID, after the ID `after`
+        """
+        table = self._table(cls)
+        rows = self._conn.execute(
+            'SELECT data FROM "{}" WHERE id > ? ORDER BY id LIMIT ?'
+            .format(table), ('' if after is None else after, limit))
+        return [cls(**fast_json.loads(row[0])) for row in rows]
+
+    def search(self, cls, attributes: dict = {}) -> List[TypeVar('Base')]:
+        """ All objects with matching attributes: indexed attributes are
+        matched in SQL, the others on the loaded objects
+        """
+        table = self._table(cls)
+        where = []
+        values = []
+        others = {}
+        for k, v in attributes.items():
+            if k in ('id',) + tuple(cls.indexed_attributes) and \
+                    (v is None or type(v) in (str, int, float)):
+                where.append('"{}" IS ?'.format(k))
+                values.append(v)
+            else:
+                others[k] = v
+        sql = 'SELECT data FROM "{}"'.format(table)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        result = []
+        for row in self._conn.execute(sql, values):
+            obj = cls(**fast_json.loads(row[0]))
+            if all(getattr(obj, k) == v for k, v in others.items()):
+                result.append(obj)
+        return result